@@ -1,9 +1,93 @@
-import firebase_admin
-from firebase_admin import credentials, auth, firestore
+import json
+import re
+import threading
+import time
 
-# Load Firebase credentials
-cred = credentials.Certificate("PennyWise.json")
-firebase_admin.initialize_app(cred)
+import requests
+from cryptography.x509 import load_pem_x509_certificate
 
-# Firestore database instance
-db = firestore.client()
+CREDENTIALS_PATH = "PennyWise.json"
+
+with open(CREDENTIALS_PATH) as _f:
+    PROJECT_ID = json.load(_f)["project_id"]
+
+# firebase_admin is initialized lazily: importing and initializing it runs
+# certificate parsing and SSL setup that costs hundreds of ms on cold start,
+# and token verification no longer needs it at all
+_firebase_lock = threading.Lock()
+_auth = None
+_db = None
+
+def get_auth():
+    """Initializes firebase_admin on first use and returns its auth module"""
+    global _auth
+    if _auth is None:
+        with _firebase_lock:
+            if _auth is None:
+                import firebase_admin
+                from firebase_admin import credentials, auth
+                cred = credentials.Certificate(CREDENTIALS_PATH)
+                firebase_admin.initialize_app(cred)
+                _auth = auth
+    return _auth
+
+def get_db():
+    """Returns the Firestore client, initializing Firebase if needed"""
+    global _db
+    if _db is None:
+        get_auth()
+        with _firebase_lock:
+            if _db is None:
+                from firebase_admin import firestore
+                _db = firestore.client()
+    return _db
+
+# Google's token-signing certificates, cached on disk so every worker process
+# doesn't refetch them on cold start
+JWKS_URL = ("https://www.googleapis.com/robot/v1/metadata/x509/"
+            "securetoken@system.gserviceaccount.com")
+JWKS_CACHE_PATH = "/tmp/firebase_jwks.json"
+
+_jwks = {}
+_jwks_expires = 0.0
+_jwks_lock = threading.Lock()
+
+def _load_cached_certificates():
+    try:
+        with open(JWKS_CACHE_PATH) as f:
+            cached = json.load(f)
+        if cached["expires"] > time.time():
+            return cached["certs"], cached["expires"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return None, 0.0
+
+def _fetch_certificates():
+    response = requests.get(JWKS_URL, timeout=10)
+    response.raise_for_status()
+    max_age = 3600
+    match = re.search(r"max-age=(\d+)", response.headers.get("cache-control", ""))
+    if match:
+        max_age = int(match.group(1))
+    expires = time.time() + max_age
+    certs = response.json()
+    try:
+        with open(JWKS_CACHE_PATH, "w") as f:
+            json.dump({"expires": expires, "certs": certs}, f)
+    except OSError:
+        pass  # cache is best-effort; verification still works without it
+    return certs, expires
+
+def get_public_key(kid):
+    """Returns the RSA public key for a token signing-key id"""
+    global _jwks, _jwks_expires
+    with _jwks_lock:
+        if kid in _jwks and _jwks_expires > time.time():
+            return _jwks[kid]
+        certs, expires = _load_cached_certificates()
+        if certs is None or kid not in certs:
+            certs, expires = _fetch_certificates()
+        _jwks = {k: load_pem_x509_certificate(pem.encode()).public_key()
+                 for k, pem in certs.items()}
+        _jwks_expires = expires
+        return _jwks[kid]
@@ -1,13 +1,22 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List
-from collections import defaultdict
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
+from cachetools import TTLCache
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError, InvalidHashError
+import aiosqlite
+import asyncio
+import orjson
 import sqlite3
 import hashlib
 import datetime
-from fastapi.responses import FileResponse
-from firebase_config import auth  # Import Firebase Auth
+import threading
+import time
+from fastapi.responses import ORJSONResponse
+import jwt
+from firebase_config import get_public_key, PROJECT_ID  # Firebase token verification
 
 app = FastAPI()
 
@@ -28,29 +37,131 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress list responses; tiny payloads aren't worth the gzip header
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
+# Token cache: verified payloads are kept until their exp claim (capped at
+# 5 minutes) so repeat requests from the same client skip RSA verification
+_token_cache = TTLCache(maxsize=10000, ttl=300)
+_token_cache_lock = threading.Lock()
+
+def _decode_token(token: str):
+    """Verifies a Firebase ID token locally against Google's cached signing keys"""
+    header = jwt.get_unverified_header(token)
+    public_key = get_public_key(header["kid"])
+    return jwt.decode(
+        token,
+        public_key,
+        algorithms=["RS256"],
+        audience=PROJECT_ID,
+        issuer=f"https://securetoken.google.com/{PROJECT_ID}",
+    )
+
 # Firebase Authentication Middleware
-def verify_token(token: str):
+async def verify_token(token: str):
     """Verifies Firebase ID token"""
+    key = hashlib.sha256(token.encode()).digest()[:32]
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+    if cached is not None:
+        decoded_token, exp = cached
+        if exp > now:
+            return decoded_token
     try:
-        decoded_token = auth.verify_id_token(token)
-        return decoded_token
+        # RSA math plus a possible public-key fetch; keep it off the event loop
+        decoded_token = await asyncio.to_thread(_decode_token, token)
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    exp = decoded_token.get("exp", now)
+    if exp > now:
+        with _token_cache_lock:
+            _token_cache[key] = (decoded_token, exp)
+    return decoded_token
 
 @app.get("/protected")
 def protected_route(user=Depends(verify_token)):
     """Example protected route"""
     return {"message": "Welcome to a protected route!", "user": user}
 
-# Database Connection
-def get_db_connection():
-    conn = sqlite3.connect("pennywise.db")
-    conn.row_factory = sqlite3.Row
+# Database Connection Pools: under WAL, readers never take the writer lock,
+# so read-only connections can proceed fully concurrently with the writer
+DB_PATH = "pennywise.db"
+READ_POOL_SIZE = 16
+WRITE_POOL_SIZE = 4
+
+# The insert statements use RETURNING, which needs SQLite 3.35+
+if sqlite3.sqlite_version_info < (3, 35):
+    raise RuntimeError(f"SQLite 3.35+ required, found {sqlite3.sqlite_version}")
+
+# SQL statements as module constants: sqlite3 caches prepared statements by
+# SQL text, so reusing the same string object skips re-parsing on every call
+SQL_INSERT_USER = "INSERT INTO users (email, password) VALUES (?, ?) ON CONFLICT(email) DO NOTHING RETURNING email"
+SQL_SELECT_USER_PASSWORD = "SELECT password FROM users WHERE email = ?"
+SQL_INSERT_EXPENSE = "INSERT INTO expenses (description, amount, category, date) VALUES (?, ?, ?, ?)"
+SQL_INSERT_EXPENSE_RETURNING = SQL_INSERT_EXPENSE + " RETURNING id"
+SQL_SELECT_EXPENSES = "SELECT * FROM expenses ORDER BY date ASC"
+SQL_DELETE_EXPENSE = "DELETE FROM expenses WHERE id = ?"
+SQL_EXPENSES_GRAPH = "SELECT date, SUM(amount) AS total FROM expenses GROUP BY date ORDER BY date ASC"
+SQL_INSERT_GOAL = "INSERT INTO goals (description, amount, progress) VALUES (?, ?, ?) RETURNING id"
+SQL_SELECT_GOALS = "SELECT id, description, amount, progress FROM goals"
+SQL_UPDATE_GOAL = ("UPDATE goals SET description = COALESCE(?, description), "
+                   "amount = COALESCE(?, amount), progress = COALESCE(?, progress) "
+                   "WHERE id = ? RETURNING id, description, amount, progress")
+SQL_DELETE_GOAL = "DELETE FROM goals WHERE id = ?"
+SQL_EXPENSES_FINGERPRINT = "SELECT COALESCE(MAX(id), 0), COUNT(*) FROM expenses"
+
+def _make_etag(*parts):
+    """Builds a short ETag from whatever identifies the dataset's version"""
+    raw = ":".join(str(part) for part in parts).encode()
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+async def _make_connection(query_only=False):
+    conn = await aiosqlite.connect(DB_PATH, isolation_level=None, cached_statements=256)
+    conn.row_factory = aiosqlite.Row
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    await conn.execute("PRAGMA temp_store=MEMORY")
+    await conn.execute("PRAGMA mmap_size=268435456")
+    if query_only:
+        await conn.execute("PRAGMA query_only=1")
     return conn
 
+_read_pool = asyncio.Queue(maxsize=READ_POOL_SIZE)
+_write_pool = asyncio.Queue(maxsize=WRITE_POOL_SIZE)
+
+async def db_conn_read():
+    """Yields a pooled read-only connection, returning it to the pool afterwards"""
+    conn = await _read_pool.get()
+    try:
+        yield conn
+    finally:
+        _read_pool.put_nowait(conn)
+
+async def db_conn_write():
+    """Yields a pooled writable connection, returning it to the pool afterwards"""
+    conn = await _write_pool.get()
+    try:
+        yield conn
+    finally:
+        _write_pool.put_nowait(conn)
+
+@app.on_event("startup")
+async def open_pools():
+    for _ in range(READ_POOL_SIZE):
+        _read_pool.put_nowait(await _make_connection(query_only=True))
+    for _ in range(WRITE_POOL_SIZE):
+        _write_pool.put_nowait(await _make_connection())
+
+@app.on_event("shutdown")
+async def close_pools():
+    for pool in (_read_pool, _write_pool):
+        while not pool.empty():
+            await pool.get_nowait().close()
+
 # Initialize Database
 def init_db():
-    conn = get_db_connection()
+    conn = sqlite3.connect(DB_PATH)
     with conn:
         conn.execute('''CREATE TABLE IF NOT EXISTS users (
                             email TEXT PRIMARY KEY,
@@ -66,24 +177,33 @@ def init_db():
                             description TEXT NOT NULL,
                             amount REAL NOT NULL,
                             progress REAL NOT NULL)''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS idx_expenses_date
+                            ON expenses(date)''')
+        conn.execute('''CREATE INDEX IF NOT EXISTS idx_expenses_cat_date
+                            ON expenses(category, date)''')
     conn.close()
 
 init_db()
 
-# Hash Password
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+# Password Hasher (argon2id; ~10ms per verify, only paid on the login path)
+_ph = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
 
 # Pydantic Models
 class UserLogin(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     email: str
     password: str
 
 class UserRegister(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     email: str
     password: str
 
 class Expense(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     description: str
     amount: float
     category: str
@@ -93,6 +213,8 @@ class ExpenseInDB(Expense):
     id: int
 
 class Goal(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     description: str
     amount: float
     progress: float
@@ -100,162 +222,165 @@ class Goal(BaseModel):
 class GoalInDB(Goal):
     id: int
 
+class GoalUpdate(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    description: Optional[str] = None
+    amount: Optional[float] = None
+    progress: Optional[float] = None
+
+# Static response, encoded once at import time
+_ROOT_BYTES = orjson.dumps({"message": "Welcome to PennyWise API"})
+
 @app.get("/")
 async def root():
-    return {"message": "Welcome to PennyWise API"}
+    return Response(content=_ROOT_BYTES, media_type="application/json")
 
 # Register User
 @app.post("/register")
-async def register_user(user: UserRegister):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    hashed_password = hash_password(user.password)
-    try:
-        cursor.execute("INSERT INTO users (email, password) VALUES (?, ?)", (user.email, hashed_password))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        conn.close()
+async def register_user(user: UserRegister, conn=Depends(db_conn_write)):
+    hashed_password = _ph.hash(user.password)
+    cursor = await conn.execute(SQL_INSERT_USER, (user.email, hashed_password))
+    if await cursor.fetchone() is None:
         raise HTTPException(status_code=400, detail="Email already registered")
-    conn.close()
     return {"message": "User registered successfully"}
 
 # Login User
 @app.post("/login")
-async def login_user(user: UserLogin):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT password FROM users WHERE email = ?", (user.email,))
-    record = cursor.fetchone()
-    if record and record["password"] == hash_password(user.password):
-        conn.close()
-        return {"message": "Login successful"}
-    conn.close()
+async def login_user(user: UserLogin, conn=Depends(db_conn_read)):
+    cursor = await conn.execute(SQL_SELECT_USER_PASSWORD, (user.email,))
+    record = await cursor.fetchone()
+    if record:
+        try:
+            _ph.verify(record["password"], user.password)
+            return {"message": "Login successful"}
+        except (VerifyMismatchError, InvalidHashError):
+            pass
     raise HTTPException(status_code=401, detail="Invalid credentials")
 
 # Add Expense
-@app.post("/expenses/", response_model=ExpenseInDB)
-async def add_expense(expense: Expense, user=Depends(verify_token)):  # Protect this route
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
+@app.post("/expenses/")
+async def add_expense(expense: Expense, user=Depends(verify_token), conn=Depends(db_conn_write)):  # Protect this route
     # Ensure date is in 'YYYY-MM-DD' format
     try:
-        formatted_date = datetime.datetime.strptime(expense.date, "%Y-%m-%d").date()
+        formatted_date = datetime.date.fromisoformat(expense.date)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
 
-    cursor.execute("INSERT INTO expenses (description, amount, category, date) VALUES (?, ?, ?, ?)", 
-                   (expense.description, expense.amount, expense.category, formatted_date))
-    expense_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return {**expense.dict(), "id": expense_id}
+    cursor = await conn.execute(SQL_INSERT_EXPENSE_RETURNING,
+                                (expense.description, expense.amount, expense.category, formatted_date))
+    expense_id = (await cursor.fetchone())[0]
+    return {"id": expense_id, "description": expense.description, "amount": expense.amount,
+            "category": expense.category, "date": expense.date}
+
+# Add Expenses in Bulk (Protected)
+@app.post("/expenses/bulk")
+async def add_expenses_bulk(expenses: List[Expense], user=Depends(verify_token), conn=Depends(db_conn_write)):  # Protect this route
+    # Ensure every date is in 'YYYY-MM-DD' format before touching the database
+    try:
+        [datetime.date.fromisoformat(expense.date) for expense in expenses]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
+    try:
+        await conn.execute("BEGIN")
+        await conn.executemany(
+            SQL_INSERT_EXPENSE,
+            [(expense.description, expense.amount, expense.category, expense.date) for expense in expenses]
+        )
+        await conn.execute("COMMIT")
+    except Exception:
+        await conn.execute("ROLLBACK")
+        raise
+
+    cursor = await conn.execute("SELECT last_insert_rowid()")
+    last_id = (await cursor.fetchone())[0]
+    first_id = last_id - len(expenses) + 1 if expenses else None
+    return {"inserted": len(expenses), "first_id": first_id}
 
 # Get All Expenses (Protected)
-@app.get("/expenses/", response_model=List[ExpenseInDB])
-async def get_expenses(user=Depends(verify_token)):  # Protect this route
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM expenses ORDER BY date ASC")
-    expenses = cursor.fetchall()
-    conn.close()
-    return [ExpenseInDB(**dict(expense)) for expense in expenses]
+@app.get("/expenses/", response_class=ORJSONResponse)
+async def get_expenses(request: Request, response: Response,
+                       user=Depends(verify_token), conn=Depends(db_conn_read)):  # Protect this route
+    # Expenses only ever get inserted or deleted, and AUTOINCREMENT never
+    # reuses ids, so MAX(id) plus COUNT(*) fingerprints the whole table
+    cursor = await conn.execute(SQL_EXPENSES_FINGERPRINT)
+    max_id, count = await cursor.fetchone()
+    etag = _make_etag(max_id, count)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304)
+    response.headers["ETag"] = etag
+
+    cursor = await conn.execute(SQL_SELECT_EXPENSES)
+    expenses = await cursor.fetchall()
+    # Rows come straight from our own table; re-validating them through
+    # Pydantic on the way out only costs time
+    return [dict(expense) for expense in expenses]
 
 # Delete Expense (Protected)
 @app.delete("/expenses/{expense_id}")
-async def delete_expense(expense_id: int, user=Depends(verify_token)):  # Protect this route
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM expenses WHERE id = ?", (expense_id,))
-    conn.commit()
-    conn.close()
+async def delete_expense(expense_id: int, user=Depends(verify_token), conn=Depends(db_conn_write)):  # Protect this route
+    await conn.execute(SQL_DELETE_EXPENSE, (expense_id,))
     return {"message": f"Expense {expense_id} deleted successfully"}
 
 # Get Expense Graph Data (Protected)
 @app.get("/expenses/graph")
-async def get_expenses_graph(user=Depends(verify_token)):  # Protect this route
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT date, amount FROM expenses ORDER BY date ASC")
-    expenses = cursor.fetchall()
-    conn.close()
-    expense_data = defaultdict(float)
-    for expense in expenses:
-        expense_data[expense["date"]] += expense["amount"]
-    formatted_data = [{"date": date, "total": total} for date, total in expense_data.items()]
-    return formatted_data
+async def get_expenses_graph(user=Depends(verify_token), conn=Depends(db_conn_read)):  # Protect this route
+    cursor = await conn.execute(SQL_EXPENSES_GRAPH)
+    return [{"date": row["date"], "total": row["total"]} for row in await cursor.fetchall()]
 
 # Create Goal (Protected)
 @app.post("/goals/", response_model=GoalInDB)
-async def create_goal(goal: Goal, user=Depends(verify_token)):  # Protect this route
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute(
-        "INSERT INTO goals (description, amount, progress) VALUES (?, ?, ?)",
-        (goal.description, goal.amount, goal.progress)
-    )
-    
-    goal_id = cursor.lastrowid  # Get last inserted ID
-    conn.commit()
-    conn.close()
-    
+async def create_goal(goal: Goal, user=Depends(verify_token), conn=Depends(db_conn_write)):  # Protect this route
+    cursor = await conn.execute(SQL_INSERT_GOAL, (goal.description, goal.amount, goal.progress))
+
+    goal_id = (await cursor.fetchone())[0]  # Id assigned by the insert
+
     return GoalInDB(id=goal_id, description=goal.description, amount=goal.amount, progress=goal.progress)
 
-# Get Goals (Protected)
-@app.get("/goals/", response_model=List[GoalInDB])
-async def get_goals(user=Depends(verify_token)):  # Protect this route
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, description, amount, progress FROM goals")  # Explicit column selection
-    goals = cursor.fetchall()
-    conn.close()
+# Serialized /goals/ payload keyed by its content ETag. The ETag hashes the
+# row contents, so any write changes the key and stale entries stop matching;
+# only the latest payload is kept
+_goals_cache = {}
 
-    return [
-        GoalInDB(id=row["id"], description=row["description"], amount=row["amount"], progress=row["progress"])
-        for row in goals
-    ]
+# Get Goals (Protected)
+@app.get("/goals/")
+async def get_goals(request: Request,
+                    user=Depends(verify_token), conn=Depends(db_conn_read)):  # Protect this route
+    cursor = await conn.execute(SQL_SELECT_GOALS)  # Explicit column selection
+    goals = await cursor.fetchall()
+
+    # Goal rows are mutated in place (progress updates), so MAX/COUNT can't
+    # version them; the table is tiny, so hash the row contents instead
+    etag = _make_etag(*[tuple(row) for row in goals])
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304)
+
+    payload = _goals_cache.get(etag)
+    if payload is None:
+        payload = orjson.dumps([dict(row) for row in goals])
+        _goals_cache.clear()
+        _goals_cache[etag] = payload
+    return Response(content=payload, media_type="application/json", headers={"ETag": etag})
 
 # Update Goal (Protected)
 @app.patch("/goals/{goal_id}", response_model=GoalInDB)
-async def update_goal(goal_id: int, goal: Goal, user=Depends(verify_token)):  # Protect this route
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Retrieve existing goal
-    cursor.execute("SELECT * FROM goals WHERE id = ?", (goal_id,))
-    existing_goal = cursor.fetchone()
-    if not existing_goal:
-        conn.close()
+async def update_goal(goal_id: int, goal: GoalUpdate, user=Depends(verify_token), conn=Depends(db_conn_write)):  # Protect this route
+    # COALESCE keeps the existing value for any field the request omits,
+    # so no separate SELECT / merge round-trip is needed
+    cursor = await conn.execute(SQL_UPDATE_GOAL,
+                                (goal.description, goal.amount, goal.progress, goal_id))
+    row = await cursor.fetchone()
+    if row is None:
         raise HTTPException(status_code=404, detail="Goal not found")
 
-    # Use existing values if the new request has missing fields
-    updated_description = goal.description if goal.description else existing_goal["description"]
-    updated_amount = goal.amount if goal.amount else existing_goal["amount"]
-    updated_progress = goal.progress if goal.progress is not None else existing_goal["progress"]
-
-    cursor.execute(
-        "UPDATE goals SET description = ?, amount = ?, progress = ? WHERE id = ?",
-        (updated_description, updated_amount, updated_progress, goal_id)
-    )
-
-    conn.commit()
-    conn.close()
-
-    return GoalInDB(id=goal_id, description=updated_description, amount=updated_amount, progress=updated_progress)
+    return GoalInDB(id=row["id"], description=row["description"], amount=row["amount"], progress=row["progress"])
 
 # Delete Goal (Protected)
 @app.delete("/goals/{goal_id}")
-async def delete_goal(goal_id: int, user=Depends(verify_token)):  # Protect this route
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("DELETE FROM goals WHERE id = ?", (goal_id,))
+async def delete_goal(goal_id: int, user=Depends(verify_token), conn=Depends(db_conn_write)):  # Protect this route
+    cursor = await conn.execute(SQL_DELETE_GOAL, (goal_id,))
     if cursor.rowcount == 0:
-        conn.close()
         raise HTTPException(status_code=404, detail="Goal not found")
 
-    conn.commit()
-    conn.close()
-    
     return {"message": "Goal deleted successfully"}